@@ -1,20 +1,95 @@
 import ast
+import codecs
+import hashlib
+import io
 import os
+import queue
 import re
 import shutil
+import signal
 import subprocess
 import tempfile
+import threading
 import time
-import uuid
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import islice
 from pathlib import Path
+from typing import BinaryIO
 
 import streamlit as st
 
 # --- Configuration ---
 TIMEOUT_SECONDS = 600  # 10 minutes
+UI_UPDATE_INTERVAL = 0.1  # Seconds between progress widget updates
+STALE_TEMP_DIR_SECONDS = 3600  # Orphaned render dirs older than this are swept
+STALE_SWEEP_INTERVAL_SECONDS = 300  # How often the sweep for them may run
+KILL_GRACE_SECONDS = 3  # Wait after SIGTERM before SIGKILL-ing a render
+ANIMATION_COUNT_CAP = 500  # Progress resolution is meaningless past this many calls
+LOG_TAIL_LINES = 500  # Render output lines kept in memory
+LOG_DISPLAY_LINES = 200  # Log lines shown in the page; the full log is a download
+RENDER_LOG_NAME = "render.log"
+VIDEO_BYTES_TTL_SECONDS = 600  # Loaded videos are kept in memory this long for re-shows
+RENDER_THREADS = min(4, os.cpu_count() or 1)  # Thread pool size for numpy/BLAS in each render
+
+
+def _max_concurrent_renders() -> int:
+    """Reads MANIM_MAX_CONCURRENT, defaulting to half the CPUs and never below 1."""
+    value = os.environ.get("MANIM_MAX_CONCURRENT", "").strip()
+    if not value:
+        return max(1, (os.cpu_count() or 2) // 2)
+    try:
+        return max(1, int(value))
+    except ValueError:
+        raise ValueError(
+            f"MANIM_MAX_CONCURRENT must be a whole number of renders, got {value!r}"
+        ) from None
+
+
+# Renders allowed to run at once across all sessions; the rest wait for a slot
+MAX_CONCURRENT_RENDERS = _max_concurrent_renders()
+
+STYLESHEET_PATH = Path(__file__).with_name("style.css")
+RENDER_CACHE_DIR = Path(tempfile.gettempdir()) / "manim-render-cache"
+SHM_DIR = Path("/dev/shm")  # RAM-backed render scratch space, when it has room
+DISK_TEMP_ROOT = Path(tempfile.gettempdir())
+SHM_MIN_FREE_BYTES = 2 * 1024**3  # tmpfs needs room for partial movies of a 4K render
+RENDER_CACHE_MAX_BYTES = 2 * 1024**3  # Oldest cached videos are evicted past this
+# Compiled LaTeX shared by every render; no manim_ prefix, so the stale sweep skips it
+TEX_CACHE_DIR = Path(tempfile.gettempdir()) / "manim-tex-cache"
+TEX_CACHE_MAX_BYTES = 64 * 1024**2  # Oldest compiled formulas are evicted past this
+
+# Render quality options (sidebar label -> manim CLI flag)
+QUALITY_FLAGS = {
+    "Low (480p, Fast)": "-ql",
+    "Medium (720p, Standard)": "-qm",
+    "High (1080p, HD)": "-qh",
+    "Extra High (1440p)": "-qp",
+    "4K (2160p)": "-qk",
+}
+
+# Renderer choices; OpenGL rasterises on the GPU but needs a display or EGL
+RENDERERS = {
+    "Cairo (CPU)": "cairo",
+    "OpenGL (GPU)": "opengl",
+}
+
+# Subdirectory manim writes each quality's video to
+QUALITY_OUTPUT_DIRS = {
+    "-ql": "480p15",
+    "-qm": "720p30",
+    "-qh": "1080p60",
+    "-qp": "1440p60",
+    "-qk": "2160p60",
+}
+
+# Qualities slow enough to get a low-quality preview render first
+PREVIEW_QUALITY_FLAG = "-ql"
+PREVIEWED_QUALITY_FLAGS = frozenset({"-qh", "-qp", "-qk"})
 
 # Known Manim Scene base classes
-SCENE_BASE_CLASSES = {
+SCENE_BASE_CLASSES = frozenset({
     "Scene",
     "ThreeDScene",
     "MovingCameraScene",
@@ -22,7 +97,28 @@ SCENE_BASE_CLASSES = {
     "VectorScene",
     "LinearTransformationScene",
     "SampleSpaceScene",
-}
+})
+
+# Names whose use implies the code expects `from manim import *`
+_MANIM_NAMES = frozenset({"Scene", "Circle", "Square", "Tex", "MathTex", "Create", "Write"})
+
+# Scene methods that produce a numbered animation in manim's output
+_ANIMATION_METHODS = frozenset({"play", "wait"})
+
+# Precompiled patterns for code scanning and manim log parsing
+_SCENE_CLASS_RE = re.compile(r"class\s+(\w+)\s*\([^)]*(?:Scene|ThreeDScene|MovingCameraScene)[^)]*\)")
+_ANIM_CALL_RE = re.compile(r"self\.(?:play|wait)\s*\(")
+# "Animation 3 : Write" -> ("3", "Write"); the name is optional
+_ANIM_RE = re.compile(r"animation\s+(\d+)(?:\s*:\s*(\w+))?", re.IGNORECASE)
+_PCT_RE = re.compile(r"(\d+)%")
+# Any of _MANIM_NAMES anywhere in a word (ThreeDScene, Text), for code that doesn't parse
+_MANIM_NAME_RE = re.compile("|".join(sorted(_MANIM_NAMES)))
+# Zero-width lookahead so overlapping keywords are all reported, matching
+# the substring semantics of separate `in` checks in a single scan
+_KEYWORD_RE = re.compile(
+    r"(?=(error|traceback|tex|writing|compiling|animation|partial movie|combining"
+    r"|concatenat|saved|file ready|movie ready|scene))"
+)
 
 st.set_page_config(
     page_title="Manim Render Studio",
@@ -31,156 +127,552 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-st.markdown(
-    """
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Manrope:wght@400;500;600&family=Playfair+Display:wght@600;700&display=swap');
 
-    .stApp {
-        background: radial-gradient(circle at 10% 20%, rgba(255, 244, 235, 0.9), transparent 50%),
-                    linear-gradient(180deg, #f7f8fb 0%, #eef1f6 100%);
-        color: #1f2a37;
-    }
-    .main .block-container {
-        padding-top: 2rem;
-        padding-bottom: 2.5rem;
-        max-width: 1200px;
-    }
-    body, div, p, label, input, textarea {
-        font-family: 'Manrope', sans-serif;
-    }
-    h1, h2, h3 {
-        font-family: 'Playfair Display', serif;
-        font-weight: 700;
-        color: #1f2a37;
-    }
-    .stButton>button {
-        background: linear-gradient(135deg, #ff6b6b, #ff4b4b);
-        color: white;
-        border-radius: 10px;
-        padding: 0.6rem 2.2rem;
-        font-weight: 600;
-        border: none;
-        transition: all 0.3s ease;
-        box-shadow: 0 10px 20px rgba(255, 75, 75, 0.2);
-    }
-    .stButton>button:hover {
-        transform: translateY(-1px);
-        box-shadow: 0 12px 24px rgba(255, 75, 75, 0.3);
-    }
-    .stTextArea textarea {
-        font-family: ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, "Liberation Mono", "Courier New", monospace;
-        border-radius: 12px;
-        border: 1px solid #e0e0e0;
-        background-color: #fbfbfd;
-    }
-    div[data-testid="stExpander"] {
-        border: none;
-        box-shadow: 0 8px 20px rgba(15, 23, 42, 0.08);
-        background-color: white;
-        border-radius: 12px;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
+@st.cache_resource(show_spinner=False)
+def _load_css() -> str:
+    """Reads the app stylesheet once per server process."""
+    return f"<style>\n{STYLESHEET_PATH.read_text(encoding='utf-8')}</style>"
+
+
+st.markdown(_load_css(), unsafe_allow_html=True)
 
 
 # --- Helper Functions ---
+def _pick_render_temp_root() -> Path:
+    """Prefers RAM-backed /dev/shm for render scratch space while it has room.
+
+    Docker gives /dev/shm only 64 MB by default, so it is only used when it
+    has room for a high-quality render. This is checked for every new render
+    directory, so /dev/shm stops taking sessions once they have used up its
+    headroom instead of filling RAM.
+    """
+    try:
+        if (
+            SHM_DIR.is_dir()
+            and os.access(SHM_DIR, os.W_OK)
+            and shutil.disk_usage(SHM_DIR).free >= SHM_MIN_FREE_BYTES
+        ):
+            return SHM_DIR
+    except OSError:
+        pass
+    return DISK_TEMP_ROOT
+
+
+@st.cache_resource(show_spinner=False)
+def _background_pool() -> ThreadPoolExecutor:
+    """Shared workers for filesystem housekeeping off the script thread."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="manim-housekeeping")
+
+
 def create_temp_dir() -> Path:
-    """Creates a unique temporary directory for this render session."""
-    unique_id = uuid.uuid4().hex[:8]
-    temp_dir = Path(tempfile.gettempdir()) / f"manim_{unique_id}"
+    """Creates a unique temporary directory for renders."""
+    unique_id = os.urandom(5).hex()
+    temp_dir = _pick_render_temp_root() / f"manim_{unique_id}"
     temp_dir.mkdir(parents=True, exist_ok=True)
     return temp_dir
 
 
+def session_media_dir(fresh: bool = False) -> Path:
+    """Returns this browser session's render directory.
+
+    The directory is kept between renders so manim can reuse its partial movie
+    files and LaTeX output for animations that did not change. With fresh=True
+    the old directory is discarded and a new one started.
+    """
+    media_dir = st.session_state.get("media_dir")
+    if media_dir is not None and media_dir.parent == SHM_DIR and _pick_render_temp_root() != SHM_DIR:
+        fresh = True  # /dev/shm is running low; move this session to disk
+    if fresh and media_dir is not None:
+        cleanup_temp_dir(media_dir)
+        media_dir = None
+    if media_dir is None:
+        media_dir = create_temp_dir()
+        st.session_state["media_dir"] = media_dir
+    media_dir.mkdir(parents=True, exist_ok=True)  # May have been swept while idle
+    os.utime(media_dir)  # Keep the stale sweep away while the session is active
+    return media_dir
+
+
+def discard_final_outputs(media_dir: Path, output_name: str = "output.mp4") -> None:
+    """Deletes finished videos left from earlier renders, keeping manim's caches."""
+    videos_dir = media_dir / "videos" / "scene"
+    try:
+        with os.scandir(videos_dir) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    try:
+                        os.remove(os.path.join(entry.path, output_name))
+                    except FileNotFoundError:
+                        pass
+    except OSError:
+        pass  # Nothing rendered here yet
+
+
+def discard_partial_movies(media_dir: Path) -> None:
+    """Drops manim's per-animation movies, for renders that can't reuse them.
+
+    Each directory is renamed aside first, so a following render starts from
+    an empty one; the deletion itself runs in the background.
+    """
+    videos_dir = media_dir / "videos" / "scene"
+    try:
+        with os.scandir(videos_dir) as entries:
+            for entry in entries:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                partial_dir = os.path.join(entry.path, "partial_movie_files")
+                trash_dir = f"{partial_dir}.trash_{os.urandom(5).hex()}"
+                try:
+                    os.rename(partial_dir, trash_dir)
+                except OSError:
+                    continue  # No partial movies at this resolution
+                _background_pool().submit(shutil.rmtree, trash_dir, ignore_errors=True)
+    except OSError:
+        pass  # Nothing rendered here yet
+
+
+def _svg_names(directory: Path) -> set[str]:
+    """Names of the SVG files directly inside directory."""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries if entry.name.endswith(".svg")}
+    except OSError:
+        return set()
+
+
+def _link_or_copy(source: Path, target: Path) -> None:
+    """Hard-links source to target, copying when they are on different filesystems."""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def seed_tex_dir(media_dir: Path) -> None:
+    """Hard-links the LaTeX other renders have compiled into media_dir/Tex.
+
+    manim names each compiled formula's SVG by a hash of its source and skips
+    latex and dvisvgm when that file exists. manim writes into this private
+    directory only, so renders never see each other's half-written files.
+    Seeding never copies: when media_dir is on another filesystem (such as
+    /dev/shm) the render simply compiles its own formulas.
+    """
+    tex_dir = media_dir / "Tex"
+    tex_dir.mkdir(parents=True, exist_ok=True)
+    for name in _svg_names(TEX_CACHE_DIR) - _svg_names(tex_dir):
+        try:
+            os.link(TEX_CACHE_DIR / name, tex_dir / name)
+        except FileNotFoundError:
+            continue  # Evicted meanwhile; manim compiles it again
+        except OSError:
+            return  # Cross-device or no hard links here; don't copy the cache
+
+
+def publish_tex_dir(media_dir: Path) -> None:
+    """Adds the LaTeX a successful render compiled to the shared cache.
+
+    Each file is staged under a unique name and renamed into place, so the
+    cache only ever holds complete SVGs. The cache is trimmed in the
+    background.
+    """
+    tex_dir = media_dir / "Tex"
+    new_names = _svg_names(tex_dir) - _svg_names(TEX_CACHE_DIR)
+    if not new_names:
+        return
+    try:
+        TEX_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return  # Sharing is best effort
+    for name in new_names:
+        staging_path = TEX_CACHE_DIR / f"{os.urandom(16).hex()}.part"
+        try:
+            _link_or_copy(tex_dir / name, staging_path)
+            os.replace(staging_path, TEX_CACHE_DIR / name)
+        except OSError:
+            staging_path.unlink(missing_ok=True)
+    _background_pool().submit(_evict_oldest, TEX_CACHE_DIR, ".svg", TEX_CACHE_MAX_BYTES)
+
+
 def cleanup_temp_dir(temp_dir: Path) -> None:
-    """Safely removes the temporary directory."""
+    """Removes the temporary directory on a background thread so the UI isn't blocked."""
+    # Renaming is a single metadata op; the slow delete then never races a
+    # reader of the original path. The trash name still matches the stale sweep.
+    trash_dir = temp_dir.with_name(f"manim_trash_{os.urandom(5).hex()}")
     try:
-        if temp_dir.exists():
-            shutil.rmtree(temp_dir)
-    except Exception:
-        pass  # Ignore cleanup errors
-
-
-def find_video_file(output_dir: Path, output_name: str = "output.mp4") -> Path | None:
-    """Recursively finds the mp4 file in the output directory."""
-    # First try the expected output path
-    expected_paths = [
-        output_dir / "videos" / "scene" / "480p15" / output_name,
-        output_dir / "videos" / "scene" / "720p30" / output_name,
-        output_dir / "videos" / "scene" / "1080p60" / output_name,
-        output_dir / "videos" / "scene" / "1440p60" / output_name,
-        output_dir / "videos" / "scene" / "2160p60" / output_name,
-        output_dir / output_name,
-    ]
-    
+        os.rename(temp_dir, trash_dir)
+    except OSError:
+        trash_dir = temp_dir
+    _background_pool().submit(shutil.rmtree, trash_dir, ignore_errors=True)
+
+
+def _remove_stale_temp_dirs() -> None:
+    """Deletes render directories idle for longer than STALE_TEMP_DIR_SECONDS.
+
+    That covers session directories of closed browser tabs, which are never
+    cleaned up explicitly, and anything left behind by earlier processes.
+    """
+    cutoff = time.time() - STALE_TEMP_DIR_SECONDS
+    for root in {SHM_DIR, DISK_TEMP_ROOT}:
+        try:
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if not entry.name.startswith("manim_"):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                            shutil.rmtree(entry.path, ignore_errors=True)
+                    except OSError:
+                        pass  # Ignore cleanup errors
+        except OSError:
+            pass  # No /dev/shm on this platform
+
+
+@st.cache_resource(show_spinner=False)
+def _stale_sweep_schedule() -> dict:
+    """When the next stale sweep may run, shared by all sessions."""
+    return {"lock": threading.Lock(), "next_run": 0.0}
+
+
+def schedule_stale_temp_sweep() -> None:
+    """Queues the stale directory sweep, at most once per STALE_SWEEP_INTERVAL_SECONDS."""
+    schedule = _stale_sweep_schedule()
+    now = time.monotonic()
+    with schedule["lock"]:
+        if now < schedule["next_run"]:
+            return
+        schedule["next_run"] = now + STALE_SWEEP_INTERVAL_SECONDS
+    _background_pool().submit(_remove_stale_temp_dirs)
+
+
+def write_if_changed(path: Path, text: str) -> None:
+    """Writes text to path as UTF-8 unless the file already holds exactly that."""
+    data = text.encode("utf-8")
+    try:
+        if path.read_bytes() == data:
+            return
+    except FileNotFoundError:
+        pass
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def find_video_file(
+    output_dir: Path,
+    quality_flag: str | None = None,
+    output_name: str = "output.mp4",
+) -> Path | None:
+    """Finds the rendered mp4, checking the quality's expected path first."""
+    # First try the expected output path; without a known quality, try them all
+    if quality_flag in QUALITY_OUTPUT_DIRS:
+        resolutions = [QUALITY_OUTPUT_DIRS[quality_flag]]
+    else:
+        resolutions = list(QUALITY_OUTPUT_DIRS.values())
+    expected_paths = [output_dir / "videos" / "scene" / res / output_name for res in resolutions]
+    expected_paths.append(output_dir / output_name)
+
     for path in expected_paths:
-        if path.exists():
+        if path.is_file():
             return path
     
-    # Fallback: search for any mp4 file
-    mp4_files = list(output_dir.glob("**/*.mp4"))
-    valid_files = [f for f in mp4_files if "partial_movie_files" not in str(f)]
-    if valid_files:
-        return max(valid_files, key=os.path.getmtime)
-    return None
+    # Fallback: search for the newest mp4 file
+    return _find_newest_mp4(output_dir)
+
+
+def _walk_files(root: Path) -> Iterator[os.DirEntry]:
+    """Yields the files under root, never descending into partial_movie_files.
+
+    That includes the partial_movie_files.trash_* directories that
+    discard_partial_movies leaves for background deletion.
+    """
+    stack = [str(root)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("partial_movie_files"):
+                            stack.append(entry.path)
+                    else:
+                        yield entry
+        except OSError:
+            continue  # Directory vanished or is unreadable
+
+
+def _find_newest_mp4(root: Path) -> Path | None:
+    """Walks root for the most recent mp4 outside partial_movie_files."""
+    best_path = None
+    best_mtime = -1.0
+    for entry in _walk_files(root):
+        if entry.name.endswith(".mp4"):
+            mtime = entry.stat().st_mtime
+            if mtime > best_mtime:
+                best_path, best_mtime = entry.path, mtime
+    return Path(best_path) if best_path else None
+
+
+def render_cache_path(
+    code: str, scene_name: str, quality_flag: str, renderer: str = "cairo"
+) -> Path:
+    """Returns where the video for this exact code, scene, quality and renderer is cached."""
+    digest = hashlib.blake2b(f"{scene_name}\0{code}".encode("utf-8"), digest_size=16).hexdigest()
+    suffix = "" if renderer == "cairo" else f"-{renderer}"
+    return RENDER_CACHE_DIR / f"{digest}{quality_flag}{suffix}.mp4"
+
+
+def touch_cached_render(cache_path: Path) -> bool:
+    """Marks a cached video as recently used. Returns False on a cache miss."""
+    try:
+        os.utime(cache_path)
+        return True
+    except OSError:
+        return False
+
+
+def store_cached_render(video_file: Path, cache_path: Path) -> Path | None:
+    """Moves a finished render into the cache and trims the cache in the background.
+
+    Returns the cached path, or None if the video could not be moved.
+    """
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            # Same filesystem: an atomic rename, no data copied
+            os.replace(video_file, cache_path)
+        except OSError:
+            # Across filesystems (e.g. renders on /dev/shm): copy under a
+            # unique name so concurrent sessions never see a partial file
+            staging_path = cache_path.with_name(f"{os.urandom(16).hex()}.part")
+            shutil.copyfile(video_file, staging_path)
+            os.replace(staging_path, cache_path)
+            video_file.unlink(missing_ok=True)
+    except OSError:
+        return None  # Caching is best effort
+    _background_pool().submit(_evict_oldest, RENDER_CACHE_DIR, ".mp4", RENDER_CACHE_MAX_BYTES)
+    return cache_path
+
+
+def _evict_oldest(directory: Path, suffix: str, max_bytes: int) -> None:
+    """Deletes files with suffix from directory, oldest first, until they fit max_bytes.
+
+    Cached renders are touched on every hit, so for them this is least
+    recently used.
+    """
+    files: list[tuple[float, int, str]] = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(suffix):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return
+    total_size = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total_size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_size -= size
 
 
 def get_quality_flag(quality_label: str) -> str:
-    mapping = {
-        "Low (480p, Fast)": "-ql",
-        "Medium (720p, Standard)": "-qm",
-        "High (1080p, HD)": "-qh",
-        "Extra High (1440p)": "-qp",
-        "4K (2160p)": "-qk",
-    }
-    return mapping.get(quality_label, "-qm")
+    return QUALITY_FLAGS.get(quality_label, "-qm")
+
+
+def build_manim_command(
+    script_path: Path,
+    scene_name: str,
+    media_dir: Path,
+    quality_flag: str,
+    disable_caching: bool = False,
+    renderer: str = "cairo",
+) -> list[str]:
+    """Builds the manim CLI invocation for one render."""
+    cmd = [
+        "manim",
+        str(script_path),
+        scene_name,
+        "-o",
+        "output.mp4",
+        "--media_dir",
+        str(media_dir),
+        quality_flag,
+        "-v", "INFO",  # Verbose output for progress tracking
+    ]
+    if disable_caching:
+        cmd.append("--disable_caching")
+    if renderer != "cairo":
+        # The OpenGL renderer only writes a movie file when asked to
+        cmd.extend(["--renderer", renderer, "--write_to_movie"])
+    return cmd
+
 
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _parse(code: str) -> ast.Module | None:
+    """Parses source code once per distinct buffer. Returns None on syntax errors.
 
+    The tree is shared between reruns, so callers must treat it as read-only.
+    """
+    try:
+        return ast.parse(code)
+    except SyntaxError:
+        return None
+
+
+def _iter_class_defs(statements: list) -> Iterator[ast.ClassDef]:
+    """Yields class definitions reachable through statement bodies only.
+
+    Function bodies (e.g. construct) and expressions, which make up most of a
+    scene file, are never visited.
+    """
+    for node in statements:
+        if isinstance(node, ast.ClassDef):
+            yield node
+            yield from _iter_class_defs(node.body)
+        elif not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            # Compound statements (if/try/with/for/match) may wrap class defs
+            for field in ("body", "orelse", "handlers", "finalbody", "cases"):
+                children = getattr(node, field, None)
+                if isinstance(children, list):
+                    yield from _iter_class_defs(children)
+
+
+def _base_name(base: ast.expr) -> str:
+    """Returns the trailing name of a base class expression, or '' for other forms."""
+    if isinstance(base, ast.Name):
+        return base.id
+    if isinstance(base, ast.Attribute):
+        return base.attr
+    return ""
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
 def extract_scene_classes(source_code: str) -> list[str]:
     """Extract all classes that inherit from any Scene type."""
-    try:
-        tree = ast.parse(source_code)
-        scene_classes: list[str] = []
-        for node in ast.walk(tree):
-            if not isinstance(node, ast.ClassDef):
-                continue
-            for base in node.bases:
-                base_name = None
-                if isinstance(base, ast.Name):
-                    base_name = base.id
-                elif isinstance(base, ast.Attribute):
-                    base_name = base.attr
-                if base_name and (base_name in SCENE_BASE_CLASSES or "Scene" in base_name):
-                    scene_classes.append(node.name)
-                    break
+    tree = _parse(source_code)
+    if tree is not None:
+        scene_bases = SCENE_BASE_CLASSES  # Local lookup inside the loop
+        scene_classes = [
+            node.name
+            for node in _iter_class_defs(tree.body)
+            if any(
+                base_name in scene_bases or "Scene" in base_name
+                for base_name in map(_base_name, node.bases)
+            )
+        ]
         if scene_classes:
             return scene_classes
-    except SyntaxError:
-        pass
 
     # Fallback: regex-based detection
-    pattern = r"class\s+(\w+)\s*\([^)]*(?:Scene|ThreeDScene|MovingCameraScene)[^)]*\)"
-    matches = re.findall(pattern, source_code)
+    matches = _SCENE_CLASS_RE.findall(source_code)
     return matches if matches else []
 
 
-def count_animations(source_code: str) -> int:
-    """Count the number of self.play() and self.wait() calls in the code."""
-    # Count self.play( and self.wait( calls
-    play_count = len(re.findall(r"self\.play\s*\(", source_code))
-    wait_count = len(re.findall(r"self\.wait\s*\(", source_code))
-    return max(play_count + wait_count, 1)  # At least 1 to avoid division by zero
+def _count_animation_calls(roots: list[ast.AST]) -> int:
+    """Counts self.play()/self.wait() calls under roots, up to ANIMATION_COUNT_CAP."""
+    stack = list(roots)
+    count = 0
+    while stack:
+        node = stack.pop()
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr in _ANIMATION_METHODS
+            and isinstance(node.func.value, ast.Name)
+            and node.func.value.id == "self"
+        ):
+            count += 1
+            if count >= ANIMATION_COUNT_CAP:
+                break
+        stack.extend(ast.iter_child_nodes(node))
+    return count
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def count_animations(source_code: str, scene_name: str | None = None) -> int:
+    """Count the number of self.play() and self.wait() calls in the code.
+
+    With scene_name, only that class's body is counted when it can be found,
+    so each scene of a multi-scene file gets its own total. A scene whose
+    body has no such calls (one that inherits construct) counts the whole
+    file instead. Counting stops at ANIMATION_COUNT_CAP; past that the
+    progress bar can't show the difference.
+    """
+    tree = _parse(source_code)
+    if tree is None:
+        # Unparseable code: count self.play( and self.wait( calls textually
+        matches = islice(_ANIM_CALL_RE.finditer(source_code), ANIMATION_COUNT_CAP)
+        return max(sum(1 for _ in matches), 1)
+
+    if scene_name is not None:
+        scene_defs = [node for node in _iter_class_defs(tree.body) if node.name == scene_name]
+        if scene_defs:
+            count = _count_animation_calls(scene_defs)
+            if count:
+                return count
+    return max(_count_animation_calls([tree]), 1)  # At least 1 to avoid division by zero
+
+
+class _ManimScan(ast.NodeVisitor):
+    """Single-pass scan for a manim import and for names that need one.
+
+    Stops as soon as an import is found, since nothing else matters then.
+    """
+
+    def __init__(self) -> None:
+        self.has_manim_import = False
+        self.uses_manim = False
+
+    def visit_Import(self, node: ast.Import) -> None:
+        if any(alias.name.split(".")[0] == "manim" for alias in node.names):
+            self.has_manim_import = True
+            raise StopIteration
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        if node.module and node.module.split(".")[0] == "manim":
+            self.has_manim_import = True
+            raise StopIteration
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        if _MANIM_NAME_RE.search(node.name):
+            self.uses_manim = True
+        self.generic_visit(node)
+
+    def visit_Name(self, node: ast.Name) -> None:
+        # Substring match, so ThreeDScene, MovingCameraScene and Text count too
+        if _MANIM_NAME_RE.search(node.id):
+            self.uses_manim = True
 
 
 def ensure_manim_import(code: str) -> str:
     """Ensures the code has manim import if it uses manim classes."""
-    if "from manim import" in code or "import manim" in code:
+    # Imports almost always sit at the top; skip the AST scan when one is there
+    head = code[:2048]
+    if "from manim" in head or "import manim" in head:
+        return code
+
+    tree = _parse(code)
+    if tree is None:
+        # Leave syntax errors for the pre-render check; decide on plain text
+        if "from manim import" in code or "import manim" in code:
+            return code
+        if _MANIM_NAME_RE.search(code):
+            return "from manim import *\n\n" + code
         return code
-    manim_indicators = ["Scene", "Circle", "Square", "Tex", "MathTex", "Create", "Write"]
-    if any(indicator in code for indicator in manim_indicators):
+
+    scan = _ManimScan()
+    try:
+        scan.visit(tree)
+    except StopIteration:
+        pass
+    if scan.uses_manim and not scan.has_manim_import:
         return "from manim import *\n\n" + code
     return code
 
@@ -216,54 +708,56 @@ class RenderProgressTracker:
         if not line_lower:
             return self._calculate_progress(), self.last_status
         
+        # One scan finds every progress keyword in the line
+        hits = {match.group(1) for match in _KEYWORD_RE.finditer(line_lower)}
+        
         # Detect stage transitions
-        if "error" in line_lower or "traceback" in line_lower:
+        if "error" in hits or "traceback" in hits:
             return self._calculate_progress(), f"Error: {line[:50]}..."
         
         # LaTeX compilation
-        if "tex" in line_lower and ("writing" in line_lower or "compiling" in line_lower):
+        if "tex" in hits and ("writing" in hits or "compiling" in hits):
             self.current_stage = "latex"
             self.last_status = "Compiling LaTeX..."
             return self._calculate_progress(), self.last_status
         
         # Animation detection - look for "Animation X:" pattern
-        anim_match = re.search(r"animation\s+(\d+)", line_lower)
+        anim_match = _ANIM_RE.search(line) if "animation" in hits else None
         if anim_match:
             self.current_stage = "rendering"
             self.current_animation = int(anim_match.group(1))
             
-            # Extract animation name if present
-            name_match = re.search(r"animation\s+\d+\s*:\s*(\w+)", line, re.IGNORECASE)
-            anim_name = name_match.group(1) if name_match else "animation"
+            # Animation name if present, in its original case
+            anim_name = anim_match.group(2) or "animation"
             
             self.last_status = f"Rendering {anim_name} ({self.current_animation}/{self.total_animations})"
         
         # Progress percentage within current animation
-        percent_match = re.search(r"(\d+)%", line)
-        if percent_match and self.current_stage == "rendering":
+        percent_match = _PCT_RE.search(line) if self.current_stage == "rendering" else None
+        if percent_match:
             self.current_animation_progress = int(percent_match.group(1))
             return self._calculate_progress(), self.last_status
         
         # Combining/concatenating partial movies
-        if "partial movie" in line_lower or "combining" in line_lower or "concatenat" in line_lower:
+        if "partial movie" in hits or "combining" in hits or "concatenat" in hits:
             self.current_stage = "combining"
             self.last_status = "Combining video segments..."
             return self._calculate_progress(), self.last_status
         
         # Writing final file
-        if ("writing" in line_lower or "saved" in line_lower) and "tex" not in line_lower:
+        if ("writing" in hits or "saved" in hits) and "tex" not in hits:
             self.current_stage = "writing"
             self.last_status = "Writing final video..."
             return self._calculate_progress(), self.last_status
         
         # File ready
-        if "file ready" in line_lower or "movie ready" in line_lower:
+        if "file ready" in hits or "movie ready" in hits:
             self.current_stage = "done"
             self.last_status = "Complete!"
             return 100, self.last_status
         
         # Scene initialization
-        if "scene" in line_lower and self.current_stage == "init":
+        if "scene" in hits and self.current_stage == "init":
             self.current_stage = "parsing"
             self.last_status = "Parsing scene..."
         
@@ -282,12 +776,120 @@ class RenderProgressTracker:
             completed_progress = (self.current_animation - 1) / self.total_animations
             current_progress = (self.current_animation_progress / 100) / self.total_animations
             
-            total_anim_progress = completed_progress + current_progress
+            # Loops can play more animations than were counted; stay in the stage
+            total_anim_progress = min(completed_progress + current_progress, 1.0)
             return int(render_start + (render_range * total_anim_progress))
         
         return stage_start
 
 
+def _render_env() -> dict[str, str]:
+    """Environment for manim subprocesses.
+
+    Caps the OpenMP/BLAS thread pools so concurrent renders don't oversubscribe
+    the CPU, flushes output as it is written so progress arrives promptly, and
+    skips writing bytecode for the one-off scene script. Values already set in
+    the server environment take precedence.
+    """
+    threads = str(RENDER_THREADS)
+    return {
+        "OMP_NUM_THREADS": threads,
+        "OPENBLAS_NUM_THREADS": threads,
+        "MKL_NUM_THREADS": threads,
+        "PYTHONUNBUFFERED": "1",
+        "PYTHONDONTWRITEBYTECODE": "1",
+        **os.environ,
+    }
+
+
+def _warm_manim() -> None:
+    """Runs manim once so the first render doesn't pay for a cold import.
+
+    Importing manim pulls in numpy, cairo, pango and friends; on a fresh
+    container that is seconds of disk reads, which the OS then caches for
+    every later manim process.
+    """
+    try:
+        subprocess.run(
+            ["manim", "--version"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env=_render_env(),
+            timeout=TIMEOUT_SECONDS,
+            check=False,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        pass  # The render reports a missing or broken manim itself
+
+
+@st.cache_resource(show_spinner=False)
+def _start_manim_warmup() -> None:
+    """Warms manim once per server process, in the background."""
+    _background_pool().submit(_warm_manim)
+
+
+def _new_process_group_kwargs() -> dict:
+    """Popen arguments that start the child as the leader of its own process group."""
+    if os.name == "posix":
+        return {"start_new_session": True}
+    return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+
+
+def kill_process_tree(process: subprocess.Popen, grace: float = KILL_GRACE_SECONDS) -> None:
+    """Stops a manim process together with the LaTeX/ffmpeg children it spawned.
+
+    The process must have been started with _new_process_group_kwargs().
+    """
+    if os.name != "posix":
+        subprocess.run(
+            ["taskkill", "/F", "/T", "/PID", str(process.pid)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return
+
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    try:
+        process.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        pass
+    # Escalate for anything in the group that ignored SIGTERM
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _pump_output_lines(pipe: BinaryIO, line_queue: queue.Queue) -> None:
+    """Reads a pipe in large chunks and queues the complete lines of each chunk.
+
+    As with text-mode pipes, a carriage return also ends a line, so tqdm-style
+    progress bars that redraw in place still arrive one update per line. The
+    thread holds the pipe object itself, so the descriptor stays open until
+    EOF even if the render has already returned.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    while chunk := pipe.read(65536):
+        lines = (pending + decoder.decode(chunk)).splitlines(keepends=True)
+        pending = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        if lines:
+            line_queue.put([line.rstrip("\r\n") + "\n" for line in lines])
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        line_queue.put([pending + "\n"])
+    line_queue.put(None)
+
+
+@st.cache_resource(show_spinner=False)
+def _render_slots() -> threading.BoundedSemaphore:
+    """Process-wide limit on concurrent manim renders, shared by all sessions."""
+    return threading.BoundedSemaphore(MAX_CONCURRENT_RENDERS)
+
+
 def run_manim_with_progress(
     cmd: list,
     cwd: str,
@@ -295,68 +897,150 @@ def run_manim_with_progress(
     total_animations: int,
     progress_bar,
     status_text,
+    log_path: Path | None = None,
+    cancel_event: threading.Event | None = None,
 ) -> tuple[bool, str]:
     """
     Run manim command with real-time progress updates.
     Returns (success: bool, log_output: str).
+    The complete, untruncated log is also written to log_path if given.
+    Setting cancel_event stops the render and reports it as failed.
+
+    At most MAX_CONCURRENT_RENDERS renders run at once; the timeout only
+    starts once this one has a slot.
     """
-    log_lines: list[str] = []
+    render_slots = _render_slots()
+    if not render_slots.acquire(blocking=False):
+        while not render_slots.acquire(timeout=0.5):
+            if cancel_event is not None and cancel_event.is_set():
+                return (False, "Render cancelled while waiting for a render slot\n")
+            # Re-sent on purpose: a widget call is also where Streamlit
+            # interrupts a script run whose user has moved on
+            status_text.text("Waiting for a render slot...")
+    try:
+        return _run_manim(
+            cmd, cwd, timeout, total_animations, progress_bar, status_text, log_path, cancel_event
+        )
+    finally:
+        render_slots.release()
+
+
+def _run_manim(
+    cmd: list,
+    cwd: str,
+    timeout: int,
+    total_animations: int,
+    progress_bar,
+    status_text,
+    log_path: Path | None,
+    cancel_event: threading.Event | None,
+) -> tuple[bool, str]:
+    """Body of run_manim_with_progress, run while holding a render slot."""
+    log_buf = io.StringIO()
+    log_file = None
+    if log_path is not None:
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        log_file = open(log_path, "w", encoding="utf-8")
+    # Only the most recent output is kept; chatty renders would otherwise grow
+    # the log without bound
+    output_tail: deque[str] = deque(maxlen=LOG_TAIL_LINES)
+    output_line_count = 0
+
+    def flush_output() -> None:
+        omitted = output_line_count - len(output_tail)
+        if omitted > 0:
+            log_buf.write(f"... {omitted} earlier lines omitted ...\n")
+        log_buf.writelines(output_tail)
+        output_tail.clear()
+
+    def write_log(text: str) -> None:
+        log_buf.write(text)
+        if log_file is not None:
+            log_file.write(text)
+
     tracker = RenderProgressTracker(total_animations)
     
     # Log the command being run
-    log_lines.append(f"Command: {' '.join(cmd)}\n")
-    log_lines.append(f"Working directory: {cwd}\n")
-    log_lines.append("-" * 50 + "\n")
+    write_log(f"Command: {' '.join(cmd)}\n")
+    write_log(f"Working directory: {cwd}\n")
+    write_log("-" * 50 + "\n")
     
     status_text.text("Starting render...")
     progress_bar.progress(0)
     
+    process = None
     try:
         process = subprocess.Popen(
             cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            text=True,
             cwd=cwd,
-            bufsize=1,
-            universal_newlines=True,
+            env=_render_env(),
+            bufsize=0,
+            **_new_process_group_kwargs(),
         )
         
-        start_time = time.time()
-        last_progress = 0
+        # Read stdout on a background thread so the loop below never blocks;
+        # it hands over whole batches of lines, and None marks end of stream.
+        line_queue: queue.Queue[list[str] | None] = queue.Queue()
+        threading.Thread(
+            target=_pump_output_lines,
+            args=(process.stdout, line_queue),
+            daemon=True,
+        ).start()
+
+        start_time = time.monotonic()
+        next_ui_update = start_time + UI_UPDATE_INTERVAL
+        progress = shown_progress = 0
+        status = shown_status = ""
         
         while True:
             # Check timeout
-            elapsed = time.time() - start_time
-            if elapsed > timeout:
-                process.kill()
+            if time.monotonic() - start_time > timeout:
+                kill_process_tree(process)
                 raise subprocess.TimeoutExpired(cmd, timeout)
+            if cancel_event is not None and cancel_event.is_set():
+                kill_process_tree(process)
+                flush_output()
+                write_log("\nRender cancelled\n")
+                return (False, log_buf.getvalue())
             
-            if process.stdout is None:
+            try:
+                lines = line_queue.get(timeout=0.05)
+            except queue.Empty:
+                lines = []
+            if lines is None:
                 break
             
-            line = process.stdout.readline()
-            if not line and process.poll() is not None:
-                break
+            for line in lines:
+                output_tail.append(line)
+                output_line_count += 1
+                if log_file is not None:
+                    log_file.write(line)
+                line_progress, line_status = tracker.parse_line(line)
+                # Only let progress increase (avoid flickering)
+                progress = max(progress, line_progress)
+                if line_status:
+                    status = line_status
             
-            if line:
-                log_lines.append(line)
-                progress, status = tracker.parse_line(line)
-                
-                # Only update if progress increased (avoid flickering)
-                if progress > last_progress:
-                    last_progress = progress
+            # Widget updates are websocket round-trips; coalesce them
+            now = time.monotonic()
+            if now >= next_ui_update:
+                next_ui_update = now + UI_UPDATE_INTERVAL
+                if progress != shown_progress:
+                    shown_progress = progress
                     progress_bar.progress(min(progress, 100))
-                
-                if status:
+                if status != shown_status:
+                    shown_status = status
                     status_text.text(status)
         
         # Wait for process to complete and get return code
         return_code = process.wait()
         
         # Log the return code
-        log_lines.append("-" * 50 + "\n")
-        log_lines.append(f"Process exited with code: {return_code}\n")
+        flush_output()
+        write_log("-" * 50 + "\n")
+        write_log(f"Process exited with code: {return_code}\n")
         
         # Final progress
         if return_code == 0:
@@ -365,33 +1049,263 @@ def run_manim_with_progress(
         else:
             status_text.text("Render failed!")
         
-        return (return_code == 0, "".join(log_lines))
+        return (return_code == 0, log_buf.getvalue())
         
     except subprocess.TimeoutExpired:
-        log_lines.append(f"\nProcess timed out after {timeout} seconds\n")
+        flush_output()
+        write_log(f"\nProcess timed out after {timeout} seconds\n")
         raise
     except Exception as e:
-        log_lines.append(f"\nException: {str(e)}\n")
-        return (False, "".join(log_lines))
+        flush_output()
+        write_log(f"\nException: {str(e)}\n")
+        return (False, log_buf.getvalue())
+    finally:
+        # A widget interaction interrupts this script run with a Streamlit
+        # control exception; don't leave manim rendering for nobody.
+        if process is not None and process.poll() is None:
+            kill_process_tree(process)
+        if log_file is not None:
+            log_file.close()
+
+
+def render_to_cache(
+    script_path: Path,
+    scene_name: str,
+    final_code: str,
+    media_dir: Path,
+    quality_flag: str,
+    total_animations: int,
+    progress_bar,
+    status_text,
+    disable_caching: bool = False,
+    renderer: str = "cairo",
+    refresh: bool = False,
+    cancel_event: threading.Event | None = None,
+) -> tuple[bool, str, Path | None]:
+    """
+    Render (or fetch from cache) one scene at the given quality.
+    Returns (success: bool, log_output: str, video_path: Path | None).
+    With refresh=True the render cache is not consulted, only overwritten.
+    """
+    cache_path = render_cache_path(final_code, scene_name, quality_flag, renderer)
+    if not refresh and touch_cached_render(cache_path):
+        return (True, "", cache_path)
+
+    discard_final_outputs(media_dir)
+    seed_tex_dir(media_dir)
+    success, log_output = run_manim_with_progress(
+        cmd=build_manim_command(
+            script_path, scene_name, media_dir, quality_flag, disable_caching, renderer
+        ),
+        cwd=str(script_path.parent),
+        timeout=TIMEOUT_SECONDS,
+        total_animations=total_animations,
+        progress_bar=progress_bar,
+        status_text=status_text,
+        log_path=media_dir / RENDER_LOG_NAME,
+        cancel_event=cancel_event,
+    )
+    if success:
+        publish_tex_dir(media_dir)
+    if disable_caching:
+        discard_partial_movies(media_dir)
+    video_file = find_video_file(media_dir, quality_flag) if success else None
+    if video_file is None:
+        return (success, log_output, None)
+    return (True, log_output, store_cached_render(video_file, cache_path) or video_file)
+
+
+class _ProgressProxy:
+    """Records progress and status for a render running off the script thread.
+
+    Streamlit widgets may only be updated from the script thread, so worker
+    threads report here and the script thread copies the values across.
+    """
+
+    def __init__(self):
+        self.value = 0
+        self.message = "Queued..."
+
+    def progress(self, value: int) -> None:
+        self.value = value
+
+    def text(self, message: str) -> None:
+        self.message = message
+
+
+def _render_scene_job(proxy: _ProgressProxy, **render_kwargs) -> tuple[bool, str, Path | None]:
+    """Runs render_to_cache on a worker thread, reporting any error as a failure.
+
+    An exception here would otherwise reach the script thread and hide the
+    results of the scenes that did finish.
+    """
+    try:
+        return render_to_cache(progress_bar=proxy, status_text=proxy, **render_kwargs)
+    except subprocess.TimeoutExpired:
+        proxy.text("Render timed out!")
+        return (False, f"Render timed out after {TIMEOUT_SECONDS // 60} minutes.", None)
+    except Exception as e:
+        import traceback
+        proxy.text("Render failed!")
+        return (False, f"An unexpected error occurred: {str(e)}\n\n{traceback.format_exc()}", None)
+
+
+def render_all_scenes(
+    script_path: Path,
+    scene_names: list[str],
+    final_code: str,
+    media_dir: Path,
+    quality_flag: str,
+    disable_caching: bool = False,
+    renderer: str = "cairo",
+    refresh: bool = False,
+) -> None:
+    """
+    Render several scenes of one script concurrently and show the results.
+    Each scene runs in its own manim process with its own media directory,
+    at most one per CPU core.
+    """
+    # One placeholder per scene holds its heading, status and progress bar,
+    # so clearing it leaves nothing behind above the results
+    placeholders = {}
+    slots = {}
+    for scene_name in scene_names:
+        placeholders[scene_name] = st.empty()
+        scene_box = placeholders[scene_name].container()
+        scene_box.markdown(f"**{scene_name}**")
+        slots[scene_name] = (scene_box.empty(), scene_box.progress(0))
+    proxies = {scene_name: _ProgressProxy() for scene_name in scene_names}
+    cancel_event = threading.Event()
+    results = {}
+
+    workers = min(len(scene_names), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="manim-scene") as pool:
+        futures = {
+            pool.submit(
+                _render_scene_job,
+                proxies[scene_name],
+                script_path=script_path,
+                scene_name=scene_name,
+                final_code=final_code,
+                media_dir=media_dir / "scenes" / scene_name,
+                quality_flag=quality_flag,
+                total_animations=count_animations(final_code, scene_name),
+                disable_caching=disable_caching,
+                renderer=renderer,
+                refresh=refresh,
+                cancel_event=cancel_event,
+            ): scene_name
+            for scene_name in scene_names
+        }
+        try:
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=UI_UPDATE_INTERVAL)
+                for future in done:
+                    results[futures[future]] = future.result()
+                for scene_name, (status_text, progress_bar) in slots.items():
+                    proxy = proxies[scene_name]
+                    status_text.text(proxy.message)
+                    progress_bar.progress(min(proxy.value, 100))
+        finally:
+            # Stops the remaining manim processes if this script run is
+            # interrupted; the pool then only has finished workers to join
+            cancel_event.set()
+
+    for scene_name in scene_names:
+        placeholders[scene_name].empty()
+        success, log_output, video_path = results[scene_name]
+        log_path = media_dir / "scenes" / scene_name / RENDER_LOG_NAME
+        st.subheader(scene_name)
+        if success and video_path is not None:
+            st.success("Render Successful!")
+            show_video(video_path, scene_name)
+            if log_output:
+                show_render_log(log_output, log_path, key=f"log_{scene_name}")
+        else:
+            st.error("Render Failed!" if not success else "Render completed but video file was not found.")
+            show_render_log(log_output, log_path, expanded=True, key=f"log_{scene_name}")
+
+
+def show_render_log(
+    log_output: str,
+    log_path: Path | None,
+    expanded: bool = False,
+    key: str | None = None,
+) -> None:
+    """Shows the end of a render log, offering the complete log as a download."""
+    lines = log_output.splitlines()
+    if len(lines) > LOG_DISPLAY_LINES:
+        lines = [f"... showing the last {LOG_DISPLAY_LINES} lines ...", *lines[-LOG_DISPLAY_LINES:]]
+    with st.expander("Render Logs", expanded=expanded):
+        st.code("\n".join(lines), language="text")
+        if log_path is not None and log_path.exists():
+            st.download_button(
+                label="Download Full Log",
+                data=log_path.read_bytes(),
+                file_name="render.log",
+                mime="text/plain",
+                key=key,
+            )
+
+
+@st.cache_resource(show_spinner=False, max_entries=4, ttl=VIDEO_BYTES_TTL_SECONDS)
+def _load_video_bytes(path: str, inode: int, size: int) -> bytes:
+    """Reads a video once and shares the bytes between reruns and sessions.
+
+    inode and size are only part of the cache key: a replaced file is read
+    again, while touching a cached render (which changes its mtime) is not
+    a change. Entries expire after VIDEO_BYTES_TTL_SECONDS so large videos
+    aren't pinned in memory for the life of the server. cache_resource
+    rather than cache_data, which would copy the whole video on every hit.
+    """
+    return Path(path).read_bytes()
+
+
+def show_video(video_path: Path, scene_name: str) -> None:
+    """Previews a rendered video and offers it for download.
+
+    The file is read once and the same bytes object goes to both widgets.
+    Streamlit's in-memory media storage keeps a reference, not a copy, so
+    the video is held once instead of being read and stored per widget.
+    """
+    stat = video_path.stat()
+    video_bytes = _load_video_bytes(str(video_path), stat.st_ino, stat.st_size)
+    st.video(video_bytes)
+    st.download_button(
+        label="Download Video",
+        data=video_bytes,
+        file_name=f"{scene_name}.mp4",
+        mime="video/mp4",
+    )
 
 
 # --- UI Layout ---
 
+schedule_stale_temp_sweep()
+_start_manim_warmup()
+
 with st.sidebar:
     st.title("Settings")
 
     quality = st.selectbox(
         "Render Quality",
-        [
-            "Low (480p, Fast)",
-            "Medium (720p, Standard)",
-            "High (1080p, HD)",
-            "Extra High (1440p)",
-            "4K (2160p)",
-        ],
+        list(QUALITY_FLAGS),
         index=1,
     )
 
+    renderer_label = st.selectbox(
+        "Renderer",
+        list(RENDERERS),
+        help="OpenGL draws on the GPU; the server needs a display or EGL for it.",
+    )
+
+    force_full_render = st.checkbox(
+        "Force full re-render",
+        value=False,
+        help="Ignore manim's cache of previously rendered animations.",
+    )
+
     st.info(
         """
     **Instructions:**
@@ -436,8 +1350,14 @@ code_input = st.text_area("Python Code", value=default_code, height=400)
 # Auto-detect scene classes
 scene_candidates = extract_scene_classes(code_input)
 
+render_all = False
 if scene_candidates:
     scene_name = st.selectbox("Scene Class (auto-detected)", scene_candidates)
+    if len(scene_candidates) > 1:
+        render_all = st.checkbox(
+            "Render all scenes",
+            help="Render every detected scene at once, one manim process per scene.",
+        )
 else:
     scene_name = st.text_input(
         "Scene Class Name",
@@ -445,124 +1365,195 @@ else:
         help="Could not auto-detect. Enter the class name manually.",
     )
 
-col1, col2 = st.columns([1, 4])
-with col1:
-    render_button = st.button("Render Scene")
 
-if render_button:
+@st.fragment
+def render_panel(
+    code_input: str,
+    scene_name: str,
+    scene_candidates: list[str],
+    render_all: bool,
+    quality: str,
+    renderer: str,
+    force_full_render: bool,
+) -> None:
+    """Render button and its results.
+
+    A fragment, so clicking Render reruns only this panel rather than the
+    whole page; editing the code or settings still reruns everything.
+    """
+    col1, col2 = st.columns([1, 4])
+    with col1:
+        render_button = st.button("Render Scene")
+
+    if not render_button:
+        return
     if not code_input.strip():
         st.error("Please enter some Manim code.")
-    elif not scene_name:
+        return
+    if not scene_name:
         st.error("Please specify a Scene class name.")
-    else:
-        # Prepare code (add import if missing)
-        final_code = ensure_manim_import(code_input)
+        return
 
-        # Check for syntax errors first
+    # Prepare code (add import if missing)
+    final_code = ensure_manim_import(code_input)
+
+    # Check for syntax errors first, reusing the tree cached by scene
+    # detection; only a failed parse is repeated, to report its location
+    if _parse(final_code) is None:
         try:
+            ast.parse(code_input)  # Line numbers match what the user sees
             ast.parse(final_code)
         except SyntaxError as e:
             st.error(f"Syntax error in your code at line {e.lineno}: {e.msg}")
-            st.stop()
+            return
+
+    # A mistyped class name would otherwise only fail once manim has loaded
+    tree = _parse(final_code)
+    if tree is not None:
+        class_names = [node.name for node in _iter_class_defs(tree.body)]
+        if scene_name not in class_names:
+            found = f" Classes found: {', '.join(class_names)}" if class_names else ""
+            st.error(f"Class '{scene_name}' was not found in your code.{found}")
+            return
 
-        # Count animations for progress tracking
-        total_animations = count_animations(final_code)
+    quality_flag = get_quality_flag(quality)
+    # manim's cache is unreliable with the OpenGL renderer, so it always
+    # renders from scratch
+    disable_caching = force_full_render or renderer == "opengl"
+    if render_all:
+        media_dir = session_media_dir(fresh=force_full_render)
+        script_path = media_dir / "scene.py"
+        write_if_changed(script_path, final_code)
+        render_all_scenes(
+            script_path=script_path,
+            scene_names=scene_candidates,
+            final_code=final_code,
+            media_dir=media_dir,
+            quality_flag=quality_flag,
+            disable_caching=disable_caching,
+            renderer=renderer,
+            refresh=force_full_render,
+        )
+        return
 
-        # Create unique temp directory for this render
-        temp_dir = create_temp_dir()
-        script_path = temp_dir / "scene.py"
+    # Serve identical code/scene/quality straight from the render cache; a
+    # forced re-render skips it and replaces the entry afterwards
+    cache_path = render_cache_path(final_code, scene_name, quality_flag, renderer)
+    if not force_full_render and touch_cached_render(cache_path):
+        st.success("Render Successful! (cached)")
+        show_video(cache_path, scene_name)
+        return
 
-        # UI elements for progress (defined outside try for cleanup)
-        status_text = st.empty()
-        progress_bar = st.progress(0)
+    # Count animations for progress tracking
+    total_animations = count_animations(final_code, scene_name)
 
-        try:
-            # Write code to file
-            with open(script_path, "w", encoding="utf-8") as f:
-                f.write(final_code)
-
-            # Construct Command
-            quality_flag = get_quality_flag(quality)
-            cmd = [
-                "manim",
-                str(script_path),
-                scene_name,
-                "-o",
-                "output.mp4",
-                "--media_dir",
-                str(temp_dir),
-                quality_flag,
-                "--disable_caching",
-                "-v", "INFO",  # Verbose output for progress tracking
-            ]
-
-            # Run render with progress tracking
-            success, log_output = run_manim_with_progress(
-                cmd=cmd,
-                cwd=str(temp_dir),
-                timeout=TIMEOUT_SECONDS,
+    # Reuse this session's render directory so manim's cache can skip
+    # unchanged animations, unless a full re-render was requested
+    temp_dir = session_media_dir(fresh=force_full_render)
+    script_path = temp_dir / "scene.py"
+
+    # UI elements for progress (defined outside try for cleanup)
+    status_text = st.empty()
+    progress_bar = st.progress(0)
+
+    try:
+        # Write code to file (the session dir keeps it between renders)
+        write_if_changed(script_path, final_code)
+
+        # Slow qualities get a quick low-quality preview first; if that
+        # fails the full render would too, so it is skipped
+        preview_slot = st.empty()
+        success, log_output, log_path = True, "", None
+        if quality_flag in PREVIEWED_QUALITY_FLAGS:
+            log_path = temp_dir / "preview" / RENDER_LOG_NAME
+            success, log_output, preview_path = render_to_cache(
+                script_path=script_path,
+                scene_name=scene_name,
+                final_code=final_code,
+                media_dir=temp_dir / "preview",
+                quality_flag=PREVIEW_QUALITY_FLAG,
                 total_animations=total_animations,
                 progress_bar=progress_bar,
                 status_text=status_text,
+                disable_caching=disable_caching,
+                renderer=renderer,
+                refresh=force_full_render,
             )
+            if preview_path is not None:
+                with preview_slot.container():
+                    st.info("Low-quality preview. The full-quality render is in progress...")
+                    st.video(str(preview_path))
+
+        # Run render with progress tracking; the video is moved into the
+        # render cache, or left in the temp dir (only emptied after this
+        # block) if that fails
+        video_path = None
+        if success:
+            log_path = temp_dir / RENDER_LOG_NAME
+            success, log_output, video_path = render_to_cache(
+                script_path=script_path,
+                scene_name=scene_name,
+                final_code=final_code,
+                media_dir=temp_dir,
+                quality_flag=quality_flag,
+                total_animations=total_animations,
+                progress_bar=progress_bar,
+                status_text=status_text,
+                disable_caching=disable_caching,
+                renderer=renderer,
+                refresh=True,  # The cache was checked above
+            )
+
+        # Clear progress UI
+        status_text.empty()
+        progress_bar.empty()
+        preview_slot.empty()
+
+        if success and video_path is not None:
+            # SUCCESS - Show video and download
+            st.success("Render Successful!")
+            show_video(video_path, scene_name)
 
-            # Clear progress UI
-            status_text.empty()
-            progress_bar.empty()
+            # Logs (collapsed)
+            show_render_log(log_output, log_path)
 
-            # Find video file
-            video_file = find_video_file(temp_dir)
+        elif success:
+            # Render succeeded but no video found
+            debug_lines = ["", "", "Files in temp directory (partial movies omitted):"]
+            debug_lines.extend(f"  {entry.path}" for entry in _walk_files(temp_dir))
+            debug_info = "\n".join(debug_lines) + "\n"
             
-            if success and video_file and video_file.exists():
-                # SUCCESS - Show video and download
-                st.success("Render Successful!")
-
-                # Read video bytes BEFORE cleanup
-                video_bytes = video_file.read_bytes()
-
-                # Video preview
-                st.video(video_bytes)
-
-                # Download button  
-                st.download_button(
-                    label="Download Video",
-                    data=video_bytes,
-                    file_name=f"{scene_name}.mp4",
-                    mime="video/mp4",
-                )
-
-                # Logs (collapsed)
-                with st.expander("Render Logs"):
-                    st.code(log_output, language="text")
-                    
-            elif success and not video_file:
-                # Render succeeded but no video found
-                all_files = list(temp_dir.rglob("*"))
-                debug_info = "\n\nFiles in temp directory:\n"
-                for f in all_files:
-                    if f.is_file():
-                        debug_info += f"  {f}\n"
-                
-                st.error("Render completed but video file was not found.")
-                with st.expander("Render Logs", expanded=True):
-                    st.code(log_output + debug_info, language="text")
-            else:
-                # FAILED - Show error and logs
-                st.error("Render Failed!")
-                with st.expander("Render Logs", expanded=True):
-                    st.code(log_output, language="text")
-
-        except subprocess.TimeoutExpired:
-            status_text.empty()
-            progress_bar.empty()
-            st.error(f"Render timed out after {TIMEOUT_SECONDS // 60} minutes.")
-        except Exception as e:
-            status_text.empty()
-            progress_bar.empty()
-            st.error(f"An unexpected error occurred: {str(e)}")
-            import traceback
-            with st.expander("Error Details", expanded=True):
-                st.code(traceback.format_exc(), language="text")
-        finally:
-            # Always cleanup temp directory
-            cleanup_temp_dir(temp_dir)
+            st.error("Render completed but video file was not found.")
+            show_render_log(log_output + debug_info, log_path, expanded=True)
+        else:
+            # FAILED - Show error and logs
+            st.error("Render Failed!")
+            show_render_log(log_output, log_path, expanded=True)
+
+    except subprocess.TimeoutExpired:
+        status_text.empty()
+        progress_bar.empty()
+        st.error(f"Render timed out after {TIMEOUT_SECONDS // 60} minutes.")
+    except Exception as e:
+        status_text.empty()
+        progress_bar.empty()
+        st.error(f"An unexpected error occurred: {str(e)}")
+        import traceback
+        with st.expander("Error Details", expanded=True):
+            st.code(traceback.format_exc(), language="text")
+    finally:
+        # The session directory is kept for manim's cache; only drop the
+        # finished video so it can't be mistaken for the next render's
+        discard_final_outputs(temp_dir)
+        discard_final_outputs(temp_dir / "preview")
+
+
+render_panel(
+    code_input,
+    scene_name,
+    scene_candidates,
+    render_all,
+    quality,
+    RENDERERS[renderer_label],
+    force_full_render,
+)